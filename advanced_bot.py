@@ -5,11 +5,13 @@ from calendar import monthrange
 from dotenv import load_dotenv
 import gspread
 from google.oauth2.service_account import Credentials
-from telegram import Bot, Update
+from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler
 import asyncio
 import csv
 import io
+from message_utils import format_row_fields, pack_message_blocks
+from retry_utils import retry_with_backoff
 from timezone_utils import (
     get_current_bangkok_time, get_current_bangkok_date, 
     format_bangkok_datetime, format_bangkok_date,
@@ -30,6 +32,19 @@ logger = logging.getLogger(__name__)
 DESCRIPTION, AMOUNT, CATEGORY, PERSON, NOTE = range(5)
 BUDGET_AMOUNT, SEARCH_QUERY, EDIT_SELECT, EDIT_FIELD, EDIT_VALUE = range(5, 10)
 
+# Sent when the bot rolls over to a new month's sheet
+NEW_MONTH_MESSAGE_TEMPLATE = (
+    "🎉 **CHÀO MỪNG {title}!**\n\n"
+    "📊 Đã tạo sheet mới cho tháng này\n"
+    "🎯 Hãy bắt đầu ghi chép chi tiêu!\n\n"
+    "💡 Gõ `/add` để thêm chi phí đầu tiên"
+)
+
+# Upper bound on queued notification sends, below Telegram's ~30 msg/s limit
+SEND_RATE_PER_SECOND = 25
+# How long shutdown waits for queued notifications to go out before dropping them
+SEND_DRAIN_TIMEOUT = 10
+
 def normalize_text(text):
     """
     Utility function to normalize text for case-insensitive comparisons.
@@ -56,15 +71,80 @@ class AdvancedTelegramBot:
         self.setup_google_sheets()
         
         # Ensure current month sheet exists
-        self.current_sheet = self.ensure_current_month_sheet()
+        self.set_current_sheet(self.ensure_current_month_sheet())
         
         # Get initial row count
         self.last_row_count = self.get_last_row_count()
         
+        # Notifications waiting to be sent by the background sender
+        self._send_queue = asyncio.Queue()
+        self._send_worker_task = None
+        
         # Create application
-        self.application = Application.builder().token(self.telegram_bot_token).build()
+        self.application = (
+            Application.builder()
+            .token(self.telegram_bot_token)
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+            .build()
+        )
         self.setup_handlers()
     
+    async def post_init(self, application):
+        """Start background tasks once the application is initialized"""
+        # Not application.create_task: the application isn't running yet, so it
+        # wouldn't track the task; post_stop stops it instead
+        self._send_worker_task = asyncio.create_task(self.send_worker())
+    
+    async def post_stop(self, application):
+        """Send what is still queued (bounded by SEND_DRAIN_TIMEOUT), then stop the sender.
+        Runs after Application.stop() but before shutdown(), while the bot is still open.
+        """
+        if self._send_worker_task is None:
+            return
+        
+        try:
+            await asyncio.wait_for(self._send_queue.join(), timeout=SEND_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._send_queue.qsize()} unsent notifications on shutdown")
+        
+        self._send_worker_task.cancel()
+        try:
+            await self._send_worker_task
+        except asyncio.CancelledError:
+            pass
+    
+    def enqueue_message(self, text, parse_mode='Markdown'):
+        """Queue a notification for the background sender"""
+        self._send_queue.put_nowait((text, parse_mode))
+    
+    @retry_with_backoff()
+    async def post_queued_message(self, text, parse_mode):
+        """Send one queued notification, retrying on flood control and network errors"""
+        await self.application.bot.send_message(
+            chat_id=self.telegram_chat_id,
+            text=text,
+            parse_mode=parse_mode,
+            disable_web_page_preview=True
+        )
+    
+    async def send_worker(self):
+        """Send queued notifications in order at a bounded rate.
+        Flood control and transient network errors are retried (a bounded number of
+        times, so an outage can't stall the queue indefinitely); after that, or on a
+        permanent error, the notification is logged and dropped.
+        """
+        while True:
+            text, parse_mode = await self._send_queue.get()
+            try:
+                await self.post_queued_message(text, parse_mode)
+            except Exception as e:
+                logger.error(f"Error sending queued message: {e}")
+            finally:
+                self._send_queue.task_done()
+            
+            await asyncio.sleep(1 / SEND_RATE_PER_SECOND)
+    
     def setup_google_sheets(self):
         """Setup Google Sheets API connection"""
         try:
@@ -99,6 +179,11 @@ class AdvancedTelegramBot:
         ]
         return f"{month_names[month]} {year}"
     
+    def set_current_sheet(self, sheet):
+        """Switch the active sheet, caching its upper-cased title for message headers"""
+        self.current_sheet = sheet
+        self.current_sheet_title_upper = sheet.title.upper()
+    
     def ensure_current_month_sheet(self):
         """Ensure current month sheet exists and return it"""
         sheet_name = self.get_sheet_name_for_month()
@@ -289,7 +374,7 @@ class AdvancedTelegramBot:
             # Check if we need a new month sheet
             current_month_sheet_name = self.get_sheet_name_for_month()
             if self.current_sheet.title != current_month_sheet_name:
-                self.current_sheet = self.ensure_current_month_sheet()
+                self.set_current_sheet(self.ensure_current_month_sheet())
                 self.last_row_count = self.get_last_row_count()
             
             # Log which sheet we're adding to
@@ -1178,7 +1263,7 @@ class AdvancedTelegramBot:
             # Sort by date
             sorted_days = sorted(daily_summary.keys(), key=lambda x: datetime.strptime(x + '/2025', '%d/%m/%Y'))
             
-            message = f"📊 **CHI TIÊU THEO NGÀY - {self.current_sheet.title.upper()}**\n\n"
+            message = f"📊 **CHI TIÊU THEO NGÀY - {self.current_sheet_title_upper}**\n\n"
             
             total_month = sum(day['total'] for day in daily_summary.values())
             total_transactions = sum(day['count'] for day in daily_summary.values())
@@ -1241,7 +1326,7 @@ class AdvancedTelegramBot:
                 return BUDGET_AMOUNT
             
             # Show budget status
-            message = f"💰 **NGÂN SÁCH {self.current_sheet.title.upper()}**\n\n"
+            message = f"💰 **NGÂN SÁCH {self.current_sheet_title_upper}**\n\n"
             message += f"🎯 **Ngân sách:** {budget_status['budget']:,} VNĐ\n"
             message += f"💸 **Đã chi:** {budget_status['spent']:,} VNĐ\n"
             
@@ -2065,7 +2150,7 @@ class AdvancedTelegramBot:
                 await self.send_month_end_summary()
                 
                 # Switch to new month
-                self.current_sheet = self.ensure_current_month_sheet()
+                self.set_current_sheet(self.ensure_current_month_sheet())
                 self.last_row_count = self.get_last_row_count()
                 
                 # Send new month notification
@@ -2080,24 +2165,22 @@ class AdvancedTelegramBot:
                 all_values = self.current_sheet.get_all_values()
                 new_rows = all_values[self.last_row_count:]
                 
-                # Send notification for each new row
+                # One detection timestamp for the whole batch
+                detected_at = get_bangkok_datetime_str()
+                
+                # Format each non-empty new row
+                blocks = []
                 for i, row in enumerate(new_rows):
                     # Check if row is not empty (specifically check description and amount)
                     if len(row) >= 3 and row[1].strip() and row[2].strip():
                         row_number = self.last_row_count + i + 1
-                        message = self.format_row_message(row, row_number)
-                        
-                        # Send to chat
-                        bot = Bot(token=self.telegram_bot_token)
-                        await bot.send_message(
-                            chat_id=self.telegram_chat_id,
-                            text=message,
-                            parse_mode='Markdown'
-                        )
-                        
-                        # Add small delay between messages
-                        if len(new_rows) > 1:
-                            await asyncio.sleep(1)
+                        blocks.append(self.format_row_message(row, row_number, detected_at))
+                
+                # Send the batch as few messages as possible instead of one per row.
+                # Plain text: cell values are user input and may contain Markdown characters.
+                # Rate limiting and retries are handled by send_worker.
+                for message in pack_message_blocks(blocks):
+                    self.enqueue_message(message, parse_mode=None)
                 
                 # Update last row count
                 self.last_row_count = current_count
@@ -2125,8 +2208,7 @@ class AdvancedTelegramBot:
                     percentage = (amount / summary['total'] * 100)
                     message += f"{i}. {category}: {amount:,} VNĐ ({percentage:.1f}%)\n"
                 
-                bot = Bot(token=self.telegram_bot_token)
-                await bot.send_message(
+                await self.application.bot.send_message(
                     chat_id=self.telegram_chat_id,
                     text=message,
                     parse_mode='Markdown'
@@ -2137,15 +2219,9 @@ class AdvancedTelegramBot:
     async def send_new_month_notification(self):
         """Send new month notification"""
         try:
-            message = (
-                f"🎉 **CHÀO MỪNG {self.current_sheet.title.upper()}!**\n\n"
-                f"📊 Đã tạo sheet mới cho tháng này\n"
-                f"🎯 Hãy bắt đầu ghi chép chi tiêu!\n\n"
-                f"💡 Gõ `/add` để thêm chi phí đầu tiên"
-            )
+            message = NEW_MONTH_MESSAGE_TEMPLATE.format(title=self.current_sheet_title_upper)
             
-            bot = Bot(token=self.telegram_bot_token)
-            await bot.send_message(
+            await self.application.bot.send_message(
                 chat_id=self.telegram_chat_id,
                 text=message,
                 parse_mode='Markdown'
@@ -2153,28 +2229,12 @@ class AdvancedTelegramBot:
         except Exception as e:
             logger.error(f"Error sending new month notification: {e}")
     
-    def format_row_message(self, row_data, row_number):
+    def format_row_message(self, row_data, row_number, detected_at):
         """Format row data into a readable message"""
-        message = f"🆕 **Dòng mới được thêm vào {self.current_sheet.title}** (Dòng #{row_number})\n\n"
-        
-        # Updated sheet structure with 'Người chi' column
-        headers = ['Ngày', 'Mô tả', 'Số tiền', 'Danh mục', 'Người chi', 'Ghi chú']
-        
-        for i, value in enumerate(row_data):
-            if i < len(headers) and value.strip():
-                if i == 2 and value.strip():  # Amount column
-                    try:
-                        amount = float(value.replace(',', ''))
-                        message += f"💰 **{headers[i]}**: {amount:,.0f} VNĐ\n"
-                    except:
-                        message += f"💰 **{headers[i]}**: {value}\n"
-                elif i == 4 and value.strip():  # Người chi column
-                    message += f"👤 **{headers[i]}**: {value}\n"
-                else:
-                    message += f"📝 **{headers[i]}**: {value}\n"
-        
-        message += f"\n⏰ Thời gian phát hiện: {get_bangkok_datetime_str()}"
-        return message
+        parts = [f"🆕 Dòng mới được thêm vào {self.current_sheet.title} (Dòng #{row_number})\n\n"]
+        parts.extend(format_row_fields(row_data))
+        parts.append(f"\n⏰ Thời gian phát hiện: {detected_at}")
+        return "".join(parts)
     
     def run_bot(self):
         """Run the advanced bot"""
@@ -35,6 +35,7 @@ TELEGRAM_CHAT_ID=123456789
 GOOGLE_SHEETS_ID=1a2b3c4d5e6f7g8h9i0j_example_sheet_id
 GOOGLE_SHEETS_RANGE=Sheet1!A:Z
 CHECK_INTERVAL_SECONDS=30
+MAX_CHECK_INTERVAL_SECONDS=300
 """)
     
     print("🔐 credentials.json structure:")
@@ -17,55 +17,55 @@ async def get_chat_id():
         print("❌ Không tìm thấy TELEGRAM_BOT_TOKEN trong file .env")
         return
     
-    bot = Bot(token=bot_token)
+    # async with closes the bot's HTTP connection pool once a chat ID is found
+    async with Bot(token=bot_token) as bot:
+        print("🤖 Bot đã sẵn sàng!")
+        print("📱 Hãy gửi tin nhắn cho bot trong Telegram")
+        print("⏱️  Đang chờ tin nhắn...")
     
-    print("🤖 Bot đã sẵn sàng!")
-    print("📱 Hãy gửi tin nhắn cho bot trong Telegram")
-    print("⏱️  Đang chờ tin nhắn...")
+        last_update_id = 0
     
-    last_update_id = 0
-    
-    while True:
-        try:
-            updates = await bot.get_updates(offset=last_update_id + 1)
+        while True:
+            try:
+                updates = await bot.get_updates(offset=last_update_id + 1)
             
-            for update in updates:
-                if update.message:
-                    chat_id = update.message.chat.id
-                    chat_type = update.message.chat.type
-                    username = update.message.from_user.username or "N/A"
-                    first_name = update.message.from_user.first_name or "N/A"
+                for update in updates:
+                    if update.message:
+                        chat_id = update.message.chat.id
+                        chat_type = update.message.chat.type
+                        username = update.message.from_user.username or "N/A"
+                        first_name = update.message.from_user.first_name or "N/A"
                     
-                    print(f"\n✅ Nhận được tin nhắn!")
-                    print(f"📋 Chat ID: {chat_id}")
-                    print(f"👤 Người gửi: {first_name} (@{username})")
-                    print(f"💬 Loại chat: {chat_type}")
-                    print(f"📝 Nội dung: {update.message.text}")
+                        print(f"\n✅ Nhận được tin nhắn!")
+                        print(f"📋 Chat ID: {chat_id}")
+                        print(f"👤 Người gửi: {first_name} (@{username})")
+                        print(f"💬 Loại chat: {chat_type}")
+                        print(f"📝 Nội dung: {update.message.text}")
                     
-                    print(f"\n📝 Cập nhật file .env với Chat ID này:")
-                    print(f"TELEGRAM_CHAT_ID={chat_id}")
+                        print(f"\n📝 Cập nhật file .env với Chat ID này:")
+                        print(f"TELEGRAM_CHAT_ID={chat_id}")
                     
-                    # Tự động cập nhật file .env
-                    await update_env_file(chat_id)
+                        # Tự động cập nhật file .env
+                        await update_env_file(chat_id)
                     
-                    # Gửi tin nhắn xác nhận
-                    await bot.send_message(
-                        chat_id=chat_id,
-                        text=f"✅ **Đã lấy Chat ID thành công!**\n\n"
-                             f"📋 Chat ID của bạn: `{chat_id}`\n"
-                             f"🤖 Bot đã sẵn sàng hoạt động!\n\n"
-                             f"💡 File .env đã được tự động cập nhật.",
-                        parse_mode='Markdown'
-                    )
+                        # Gửi tin nhắn xác nhận
+                        await bot.send_message(
+                            chat_id=chat_id,
+                            text=f"✅ **Đã lấy Chat ID thành công!**\n\n"
+                                 f"📋 Chat ID của bạn: `{chat_id}`\n"
+                                 f"🤖 Bot đã sẵn sàng hoạt động!\n\n"
+                                 f"💡 File .env đã được tự động cập nhật.",
+                            parse_mode='Markdown'
+                        )
                     
-                    return chat_id
+                        return chat_id
                     
-                last_update_id = update.update_id
+                    last_update_id = update.update_id
                 
-        except Exception as e:
-            print(f"❌ Lỗi: {e}")
+            except Exception as e:
+                print(f"❌ Lỗi: {e}")
             
-        await asyncio.sleep(2)
+            await asyncio.sleep(2)
 
 async def update_env_file(chat_id):
     """Cập nhật Chat ID trong file .env"""
@@ -4,9 +4,10 @@ from datetime import datetime
 from dotenv import load_dotenv
 import gspread
 from google.oauth2.service_account import Credentials
-from telegram import Bot, Update
+from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler
 import asyncio
+import random
 from timezone_utils import (
     get_current_bangkok_time, get_current_bangkok_date, 
     format_bangkok_datetime, format_bangkok_date,
@@ -26,6 +27,19 @@ logger = logging.getLogger(__name__)
 # Conversation states
 DESCRIPTION, AMOUNT, CATEGORY, PERSON, NOTE = range(5)
 
+# Longest wait between monitoring retries while the sheet check keeps failing
+MAX_BACKOFF_SECONDS = 300
+
+# Sent once when run_bot starts
+STARTUP_MESSAGE_TEMPLATE = (
+    "🤖 **Interactive Telegram Bot đã khởi động!**\n\n"
+    "💡 **Gõ `/start` để xem hướng dẫn**\n"
+    "📊 Đang theo dõi Google Sheets\n"
+    "⏱️ Kiểm tra mỗi {check_interval} giây\n"
+    "📝 Dòng hiện tại: {row_count}\n"
+    "🕐 Thời gian khởi động: {started_at}"
+)
+
 class InteractiveTelegramBot:
     def __init__(self):
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -41,6 +55,13 @@ class InteractiveTelegramBot:
         # Get initial row count
         self.last_row_count = self.get_last_row_count()
         
+        # Consecutive failed checks, drives the monitoring loop's backoff
+        self._fail_streak = 0
+        
+        # Set when the sheet is known to have changed so the monitoring loop
+        # checks right away instead of waiting for the next interval
+        self._change_event = asyncio.Event()
+        
         # Create application
         self.application = Application.builder().token(self.telegram_bot_token).build()
         self.setup_handlers()
@@ -102,6 +123,7 @@ class InteractiveTelegramBot:
             date = get_bangkok_date_str()
             row_data = [date, description, str(amount), category, person, note]
             self.sheet.append_row(row_data)
+            self._change_event.set()
             return True
         except Exception as e:
             logger.error(f"Error adding expense to sheet: {e}")
@@ -337,15 +359,19 @@ class InteractiveTelegramBot:
             await update.message.reply_text(f"❌ Lỗi khi kiểm tra trạng thái: {e}")
     
     async def check_for_new_rows(self):
-        """Check for new rows and send notifications"""
+        """Check for new rows and send notifications.
+        Errors are logged and re-raised so the monitoring loop can back off.
+        """
         try:
-            current_count = self.get_current_row_count()
+            # gspread is blocking; read in a worker thread so command
+            # handlers keep running while the Sheets request is in flight
+            all_values = await asyncio.to_thread(self.sheet.get_all_values)
+            current_count = len(all_values)
             
             if current_count > self.last_row_count:
                 logger.info(f"New rows detected: {current_count - self.last_row_count}")
                 
                 # Get new rows
-                all_values = self.sheet.get_all_values()
                 new_rows = all_values[self.last_row_count:]
                 
                 # Send notification for each new row
@@ -355,8 +381,7 @@ class InteractiveTelegramBot:
                         message = self.format_row_message(row, row_number)
                         
                         # Send to chat
-                        bot = Bot(token=self.telegram_bot_token)
-                        await bot.send_message(
+                        await self.application.bot.send_message(
                             chat_id=self.telegram_chat_id,
                             text=message,
                             parse_mode='Markdown'
@@ -372,29 +397,47 @@ class InteractiveTelegramBot:
                 
         except Exception as e:
             logger.error(f"Error checking for new rows: {e}")
+            raise
     
     def format_row_message(self, row_data, row_number):
         """Format row data into a readable message"""
-        message = f"🆕 **Dòng mới được thêm vào Google Sheets** (Dòng #{row_number})\n\n"
+        parts = [f"🆕 **Dòng mới được thêm vào Google Sheets** (Dòng #{row_number})\n\n"]
         
         # Updated sheet structure with 'Người chi' column
         headers = ['Ngày', 'Mô tả', 'Số tiền', 'Danh mục', 'Người chi', 'Ghi chú']
         
         for i, value in enumerate(row_data):
-            if i < len(headers) and value.strip():
-                if i == 2 and value.strip():  # Amount column
-                    try:
-                        amount = float(value.replace(',', ''))
-                        message += f"💰 **{headers[i]}**: {amount:,.0f} VNĐ\n"
-                    except:
-                        message += f"💰 **{headers[i]}**: {value}\n"
-                elif i == 4 and value.strip():  # Người chi column
-                    message += f"👤 **{headers[i]}**: {value}\n"
-                else:
-                    message += f"📝 **{headers[i]}**: {value}\n"
+            if i >= len(headers):
+                break
+            if not value.strip():
+                continue
+            
+            if i == 2:  # Amount column
+                try:
+                    amount = float(value.replace(',', ''))
+                    parts.append(f"💰 **{headers[i]}**: {amount:,.0f} VNĐ\n")
+                except:
+                    parts.append(f"💰 **{headers[i]}**: {value}\n")
+            elif i == 4:  # Người chi column
+                parts.append(f"👤 **{headers[i]}**: {value}\n")
+            else:
+                parts.append(f"📝 **{headers[i]}**: {value}\n")
         
-        message += f"\n⏰ Thời gian phát hiện: {get_bangkok_datetime_str()}"
-        return message
+        parts.append(f"\n⏰ Thời gian phát hiện: {get_bangkok_datetime_str()}")
+        return "".join(parts)
+    
+    async def wait_for_change(self, timeout):
+        """Wait until the sheet is flagged as changed or the timeout expires"""
+        try:
+            await asyncio.wait_for(self._change_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._change_event.clear()
+    
+    def log_startup_message_result(self, task):
+        """Log a failed background startup message send"""
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error sending startup message: {task.exception()}")
     
     async def run_bot(self):
         """Run the interactive bot"""
@@ -405,32 +448,47 @@ class InteractiveTelegramBot:
         await self.application.start()
         
         # Send startup message
-        bot = Bot(token=self.telegram_bot_token)
-        startup_message = (
-            f"🤖 **Interactive Telegram Bot đã khởi động!**\n\n"
-            f"💡 **Gõ `/start` để xem hướng dẫn**\n"
-            f"📊 Đang theo dõi Google Sheets\n"
-            f"⏱️ Kiểm tra mỗi {self.check_interval} giây\n"
-            f"📝 Dòng hiện tại: {self.last_row_count}\n"
-            f"🕐 Thời gian khởi động: {get_bangkok_datetime_str()}"
+        startup_message = STARTUP_MESSAGE_TEMPLATE.format(
+            check_interval=self.check_interval,
+            row_count=self.last_row_count,
+            started_at=get_bangkok_datetime_str()
         )
-        await bot.send_message(
-            chat_id=self.telegram_chat_id,
-            text=startup_message,
-            parse_mode='Markdown'
+        # Sent in the background so a slow or rate-limited Telegram API
+        # doesn't delay polling; keep a reference so the task isn't collected
+        self._startup_task = asyncio.create_task(
+            self.application.bot.send_message(
+                chat_id=self.telegram_chat_id,
+                text=startup_message,
+                parse_mode='Markdown'
+            )
         )
+        self._startup_task.add_done_callback(self.log_startup_message_result)
         
         # Start polling for updates
         await self.application.updater.start_polling()
         
-        # Background task to check for new rows
+        # Background task to check for new rows, scheduled on absolute
+        # deadlines so the time spent fetching doesn't push later checks back
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.check_interval
         while True:
             try:
                 await self.check_for_new_rows()
-                await asyncio.sleep(self.check_interval)
+                self._fail_streak = 0
+                await self.wait_for_change(max(0, next_tick - loop.time()))
             except Exception as e:
-                logger.error(f"Error in monitoring loop: {e}")
-                await asyncio.sleep(self.check_interval)
+                # Exponential backoff with jitter so a persistent outage
+                # (bad credentials, quota exhausted) isn't hit every interval
+                self._fail_streak += 1
+                delay = min(self.check_interval * 2 ** self._fail_streak, MAX_BACKOFF_SECONDS)
+                delay += random.uniform(0, 1)
+                logger.error(f"Error in monitoring loop: {e}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+            
+            # Skip ticks missed during a slow check instead of bursting
+            now = loop.time()
+            while next_tick <= now:
+                next_tick += self.check_interval
 
 async def main():
     """Main function"""
@@ -0,0 +1,127 @@
+"""
+Telegram message helpers shared by the bots.
+"""
+
+from functools import lru_cache
+
+
+# Messages are packed up to this size. Telegram's hard limit is 4096, counted
+# in UTF-16 code units after entity parsing; the gap leaves room for that.
+MESSAGE_BATCH_LIMIT = 3800
+
+# Placed between row blocks packed into one message
+MESSAGE_BATCH_SEPARATOR = "\n\n---\n\n"
+
+
+@lru_cache(maxsize=4096)
+def format_amount(value):
+    """Format an amount cell as VNĐ. Numeric cells arrive as numbers; cells
+    stored as text are parsed, falling back to the raw text.
+    Cached because the same amounts (rent, coffee, subscriptions) repeat a lot.
+    """
+    if isinstance(value, (int, float)):
+        return f"{value:,.0f} VNĐ"
+    try:
+        return f"{float(value.replace(',', '')):,.0f} VNĐ"
+    except ValueError:
+        return value
+
+
+# (icon, label, value formatter) for each sheet column shown in new-row
+# messages, in sheet order. Adjust this based on your actual sheet structure.
+ROW_MESSAGE_FIELDS = (
+    ("📝", "Ngày", str),
+    ("📝", "Mô tả", str),
+    ("💰", "Số tiền", format_amount),
+    ("📝", "Danh mục", str),
+    ("👤", "Người chi", str),
+    ("📝", "Ghi chú", str),
+)
+
+
+def format_row_fields(row_data):
+    """Plain-text lines for the non-empty cells of a sheet row.
+    Cells past the last column in ROW_MESSAGE_FIELDS are not shown.
+    """
+    return [
+        f"{icon} {label}: {formatter(value)}\n"
+        for (icon, label, formatter), value in zip(ROW_MESSAGE_FIELDS, row_data)
+        # Unformatted reads return numbers for numeric cells
+        if str(value).strip()
+    ]
+
+
+def telegram_length(text):
+    """Length of text as Telegram counts it (UTF-16 code units, so emoji count as 2)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_message_block(block, limit=MESSAGE_BATCH_LIMIT):
+    """Split a block longer than `limit` into pieces that fit, breaking between
+    lines where possible and inside a line only when the line itself is too long
+    """
+    pieces = []
+    current = ""
+    current_len = 0
+
+    for line in block.splitlines(keepends=True):
+        line_len = telegram_length(line)
+        if current_len + line_len <= limit:
+            current += line
+            current_len += line_len
+            continue
+        if current:
+            pieces.append(current)
+            current = ""
+            current_len = 0
+        if line_len <= limit:
+            current = line
+            current_len = line_len
+            continue
+        # A single line over the limit is cut character by character
+        for char in line:
+            char_len = telegram_length(char)
+            if current_len + char_len > limit:
+                pieces.append(current)
+                current = ""
+                current_len = 0
+            current += char
+            current_len += char_len
+
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_message_blocks(blocks, limit=MESSAGE_BATCH_LIMIT, separator=MESSAGE_BATCH_SEPARATOR):
+    """Join message blocks into as few messages as possible, each at most `limit` long.
+    A block that is too long on its own is split with split_message_block.
+    """
+    messages = []
+    current = []
+    current_len = 0
+    separator_len = telegram_length(separator)
+
+    for block in _fit_blocks(blocks, limit):
+        block_len = telegram_length(block)
+        added_len = block_len + (separator_len if current else 0)
+        if current and current_len + added_len > limit:
+            messages.append(separator.join(current))
+            current = []
+            current_len = 0
+            added_len = block_len
+        current.append(block)
+        current_len += added_len
+
+    if current:
+        messages.append(separator.join(current))
+    return messages
+
+
+def _fit_blocks(blocks, limit):
+    """Yield blocks unchanged, splitting the ones longer than `limit`"""
+    for block in blocks:
+        if telegram_length(block) > limit:
+            yield from split_message_block(block, limit)
+        else:
+            yield block
@@ -0,0 +1,69 @@
+"""
+Retry policy shared by the bots for rate-limited and transient
+Google Sheets and Telegram API errors.
+"""
+
+import time
+import random
+import asyncio
+import logging
+import functools
+
+from gspread.exceptions import APIError
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+# Attempts per call (the first try included) and the cap on the backoff between them
+RETRY_MAX_ATTEMPTS = 6
+RETRY_MAX_DELAY = 60
+
+
+def is_retryable_error(error):
+    """Rate limits (429), server errors (5xx) and network failures are worth retrying.
+    BadRequest subclasses NetworkError in PTB but is a permanent 400, so it is excluded.
+    """
+    if isinstance(error, APIError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (RetryAfter, NetworkError)) and not isinstance(error, BadRequest)
+
+
+def backoff_delay(attempt, error):
+    """Truncated exponential backoff with jitter, or Telegram's requested wait"""
+    if isinstance(error, RetryAfter):
+        return error.retry_after
+    return min(2 ** attempt + random.uniform(0, 1), RETRY_MAX_DELAY)
+
+
+def retry_with_backoff(max_attempts=RETRY_MAX_ATTEMPTS):
+    """Retry a sync or async API call on retryable errors, re-raising anything else"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_attempts):
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        if attempt == max_attempts - 1 or not is_retryable_error(e):
+                            raise
+                        delay = backoff_delay(attempt, e)
+                        logger.warning(f"{func.__name__} failed ({e}), retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if attempt == max_attempts - 1 or not is_retryable_error(e):
+                        raise
+                    delay = backoff_delay(attempt, e)
+                    logger.warning(f"{func.__name__} failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+        return wrapper
+    return decorator
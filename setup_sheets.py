@@ -1,13 +1,14 @@
 import os
-import gspread
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 from datetime import datetime
+from sheets_utils import get_gspread_client
 
 # Load environment variables
 load_dotenv()
 
 class GoogleSheetsSetup:
+    __slots__ = ('sheets_id', 'credentials_file', 'gc', 'sheet')
+    
     def __init__(self):
         self.sheets_id = os.getenv('GOOGLE_SHEETS_ID')
         self.credentials_file = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
@@ -16,17 +17,7 @@ class GoogleSheetsSetup:
     def setup_google_sheets(self):
         """Setup Google Sheets API connection"""
         try:
-            scope = [
-                'https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive'
-            ]
-            
-            creds = Credentials.from_service_account_file(
-                self.credentials_file, 
-                scopes=scope
-            )
-            
-            self.gc = gspread.authorize(creds)
+            self.gc = get_gspread_client(self.credentials_file)
             self.sheet = self.gc.open_by_key(self.sheets_id).sheet1
             print("✅ Kết nối Google Sheets thành công!")
             
@@ -38,30 +29,65 @@ class GoogleSheetsSetup:
         """Thiết lập tiêu đề cột"""
         headers = ['Ngày', 'Mô tả', 'Số tiền', 'Danh mục', 'Người chi', 'Ghi chú', 'Loại']
         
-        try:
-            # Xóa tất cả dữ liệu hiện tại
-            self.sheet.clear()
-            
-            # Thêm header vào dòng đầu tiên
-            self.sheet.insert_row(headers, 1)
-            
-            # Format header
-            self.sheet.format('A1:G1', {
-                "backgroundColor": {
-                    "red": 0.2,
-                    "green": 0.4,
-                    "blue": 0.8
+        header_range = {
+            "sheetId": self.sheet.id,
+            "startRowIndex": 0,
+            "endRowIndex": 1,
+            "startColumnIndex": 0,
+            "endColumnIndex": len(headers)
+        }
+        
+        # Gộp xóa dữ liệu, ghi header và format thành một batchUpdate
+        # (1 request thay vì 3, và được áp dụng nguyên tử)
+        body = {
+            "requests": [
+                # Xóa tất cả dữ liệu hiện tại
+                {
+                    "updateCells": {
+                        "range": {"sheetId": self.sheet.id},
+                        "fields": "userEnteredValue"
+                    }
                 },
-                "textFormat": {
-                    "foregroundColor": {
-                        "red": 1.0,
-                        "green": 1.0,
-                        "blue": 1.0
-                    },
-                    "fontSize": 12,
-                    "bold": True
+                # Thêm header vào dòng đầu tiên
+                {
+                    "updateCells": {
+                        "range": header_range,
+                        "rows": [{
+                            "values": [{"userEnteredValue": {"stringValue": h}} for h in headers]
+                        }],
+                        "fields": "userEnteredValue"
+                    }
+                },
+                # Format header
+                {
+                    "repeatCell": {
+                        "range": header_range,
+                        "cell": {
+                            "userEnteredFormat": {
+                                "backgroundColor": {
+                                    "red": 0.2,
+                                    "green": 0.4,
+                                    "blue": 0.8
+                                },
+                                "textFormat": {
+                                    "foregroundColor": {
+                                        "red": 1.0,
+                                        "green": 1.0,
+                                        "blue": 1.0
+                                    },
+                                    "fontSize": 12,
+                                    "bold": True
+                                }
+                            }
+                        },
+                        "fields": "userEnteredFormat(backgroundColor,textFormat)"
+                    }
                 }
-            })
+            ]
+        }
+        
+        try:
+            self.sheet.spreadsheet.batch_update(body)
             
             print("✅ Đã thiết lập tiêu đề cột:")
             for i, header in enumerate(headers, 1):
@@ -203,8 +229,10 @@ class GoogleSheetsSetup:
         ]
         
         try:
+            # Thêm tất cả các dòng trong một request
+            self.sheet.append_rows(sample_data)
+            
             for row_data in sample_data:
-                self.sheet.append_row(row_data)
                 print(f"   ➕ Đã thêm: {row_data[1]} - {int(row_data[2]):,} VNĐ ({row_data[4]})")
             
             print("✅ Đã thêm dữ liệu mẫu thành công!")
@@ -0,0 +1,53 @@
+"""
+Google Sheets client helpers shared by the monitor and setup scripts.
+The authorized client is cached per process so credentials are parsed and
+the HTTP session is opened only once.
+"""
+
+import socket
+from functools import lru_cache
+
+import gspread
+from google.oauth2.service_account import Credentials
+# requests and urllib3 are not pinned in requirements.txt: gspread depends on
+# requests (which pulls in urllib3), and the client session is a requests.Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+
+# OAuth scopes needed to open spreadsheets by key
+GOOGLE_SHEETS_SCOPES = [
+    'https://spreadsheets.google.com/feeds',
+    'https://www.googleapis.com/auth/drive'
+]
+
+# TCP keepalive probes stop NATs/firewalls from silently dropping pooled
+# connections while the monitor sits idle between polls
+KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, 'TCP_KEEPIDLE'):
+    KEEPALIVE_SOCKET_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 30),
+    ]
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections have TCP keepalive enabled"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+@lru_cache(maxsize=1)
+def get_gspread_client(credentials_file):
+    """Get an authorized gspread client for a service account credentials file"""
+    creds = Credentials.from_service_account_file(
+        credentials_file,
+        scopes=GOOGLE_SHEETS_SCOPES
+    )
+    client = gspread.authorize(creds)
+
+    # One small pool per Google host (Sheets, Drive, OAuth token endpoint)
+    client.session.mount('https://', KeepAliveAdapter(pool_connections=4, pool_maxsize=4))
+    return client
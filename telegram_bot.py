@@ -1,18 +1,29 @@
 import os
-import time
 import json
+import signal
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
 from telegram import Bot
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
 import asyncio
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from message_utils import format_row_fields, pack_message_blocks
 from timezone_utils import (
     get_current_bangkok_time, get_current_bangkok_date, 
     format_bangkok_datetime, format_bangkok_date,
     get_bangkok_datetime_str, get_bangkok_date_str
 )
+from sheets_utils import get_gspread_client
+from retry_utils import is_retryable_error, retry_with_backoff
 
 # Load environment variables
 load_dotenv()
@@ -24,7 +35,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Columns shown in notifications (Ngày .. Ghi chú)
+ROW_RANGE_COLUMNS = ('A', 'F')
+# Rows fetched by get_new_rows when the caller doesn't know where the data ends
+NEW_ROWS_BATCH_SIZE = 500
+# Drive file metadata; its `version` increases on every edit to the spreadsheet
+DRIVE_FILE_URL = 'https://www.googleapis.com/drive/v3/files/{}'
+# Longest time a changed row count stays only in memory (also written on shutdown)
+LAST_ROW_FLUSH_SECONDS = 300
+
+class OrjsonRequest(HTTPXRequest):
+    """HTTPXRequest that decodes Telegram API responses with orjson"""
+    
+    @staticmethod
+    def parse_json_payload(payload):
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError as exc:
+            raise TelegramError("Invalid server response") from exc
+
 class GoogleSheetsMonitor:
+    # Fixed attribute set: no per-instance __dict__ for this long-lived object
+    __slots__ = (
+        'telegram_bot_token', 'telegram_chat_id', 'sheets_id', 'sheets_range',
+        'credentials_file', 'check_interval', 'max_check_interval', 'last_row_file',
+        'bot', 'gc', 'sheet', 'last_file_version', 'idle_ticks',
+        'last_row_count', 'last_row_count_dirty'
+    )
+    
     def __init__(self):
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.telegram_chat_id = os.getenv('TELEGRAM_CHAT_ID')
@@ -32,31 +70,32 @@ class GoogleSheetsMonitor:
         self.sheets_range = os.getenv('GOOGLE_SHEETS_RANGE', 'Sheet1!A:Z')
         self.credentials_file = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
         self.check_interval = int(os.getenv('CHECK_INTERVAL_SECONDS', 30))
+        self.max_check_interval = int(os.getenv('MAX_CHECK_INTERVAL_SECONDS', 300))
         self.last_row_file = os.getenv('LAST_ROW_FILE', 'last_row.txt')
         
-        # Initialize Telegram bot
-        self.bot = Bot(token=self.telegram_bot_token)
+        # Initialize Telegram bot, decoding responses with orjson when installed
+        request = OrjsonRequest() if orjson is not None else None
+        self.bot = Bot(token=self.telegram_bot_token, request=request)
         
         # Initialize Google Sheets client
         self.setup_google_sheets()
         
+        # Drive version seen at the last poll, None until the first check
+        self.last_file_version = None
+        
+        # Consecutive polls without new rows, used to stretch the poll interval
+        self.idle_ticks = 0
+        
         # Get initial row count
         self.last_row_count = self.get_last_row_count()
+        
+        # last_row_count is kept in memory and written out by flush_last_row_count
+        self.last_row_count_dirty = False
     
     def setup_google_sheets(self):
         """Setup Google Sheets API connection"""
         try:
-            scope = [
-                'https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive'
-            ]
-            
-            creds = Credentials.from_service_account_file(
-                self.credentials_file, 
-                scopes=scope
-            )
-            
-            self.gc = gspread.authorize(creds)
+            self.gc = get_gspread_client(self.credentials_file)
             self.sheet = self.gc.open_by_key(self.sheets_id).sheet1
             logger.info("Google Sheets connection established successfully")
             
@@ -72,7 +111,7 @@ class GoogleSheetsMonitor:
                     return int(f.read().strip())
             else:
                 # If file doesn't exist, get current row count and save it
-                current_count = len(self.sheet.get_all_values())
+                current_count = self.get_current_row_count()
                 self.save_last_row_count(current_count)
                 return current_count
         except Exception as e:
@@ -80,96 +119,175 @@ class GoogleSheetsMonitor:
             return 0
     
     def save_last_row_count(self, count):
-        """Save the current row count to file"""
+        """Save the current row count to file.
+        Written to a temp file and renamed over the old one, so a crash
+        mid-write can't leave a truncated file behind.
+        """
+        tmp_file = f"{self.last_row_file}.tmp"
         try:
-            with open(self.last_row_file, 'w') as f:
+            with open(tmp_file, 'w') as f:
                 f.write(str(count))
+            os.replace(tmp_file, self.last_row_file)
         except Exception as e:
             logger.error(f"Error saving last row count: {e}")
     
+    def flush_last_row_count(self):
+        """Write last_row_count to disk if it changed since the last flush"""
+        if self.last_row_count_dirty:
+            self.save_last_row_count(self.last_row_count)
+            self.last_row_count_dirty = False
+    
+    @retry_with_backoff()
     def get_current_row_count(self):
-        """Get current number of rows in the sheet"""
-        try:
-            return len(self.sheet.get_all_values())
-        except Exception as e:
-            logger.error(f"Error getting current row count: {e}")
-            return 0
+        """Get current number of rows in the sheet.
+        Only column A ('Ngày', always filled) is fetched, so each poll transfers
+        one column instead of the whole sheet. Values are only counted, so they
+        are requested unformatted to skip server-side date formatting.
+        """
+        return len(self.sheet.col_values(1, value_render_option='UNFORMATTED_VALUE'))
     
-    def get_new_rows(self, start_row):
-        """Get new rows starting from specified row number"""
-        try:
-            all_values = self.sheet.get_all_values()
-            if len(all_values) > start_row:
-                return all_values[start_row:]
+    @retry_with_backoff()
+    def get_new_rows(self, start_row, end_row=None):
+        """Get rows after start_row up to end_row (1-based, inclusive).
+        Only that range is requested, so the cost grows with the number of
+        new rows rather than the size of the sheet.
+        """
+        if end_row is None:
+            end_row = start_row + NEW_ROWS_BATCH_SIZE
+        if end_row <= start_row:
             return []
-        except Exception as e:
-            logger.error(f"Error getting new rows: {e}")
-            return []
-    
-    def format_row_message(self, row_data, row_number):
-        """Format row data into a readable message"""
-        message = f"🆕 **Dòng mới được thêm vào Google Sheets** (Dòng #{row_number})\n\n"
-        
-        # Updated sheet structure with 'Người chi' column
-        # Adjust this based on your actual sheet structure
-        headers = ['Ngày', 'Mô tả', 'Số tiền', 'Danh mục', 'Người chi', 'Ghi chú']
         
-        for i, value in enumerate(row_data):
-            if i < len(headers) and value.strip():
-                if i == 2 and value.strip():  # Amount column
-                    try:
-                        amount = float(value.replace(',', ''))
-                        message += f"💰 **{headers[i]}**: {amount:,.0f} VNĐ\n"
-                    except:
-                        message += f"💰 **{headers[i]}**: {value}\n"
-                elif i == 4 and value.strip():  # Người chi column
-                    message += f"👤 **{headers[i]}**: {value}\n"
-                else:
-                    message += f"📝 **{headers[i]}**: {value}\n"
+        first_col, last_col = ROW_RANGE_COLUMNS
+        # Numbers come back as int/float instead of display strings like "50,000";
+        # dates keep their formatted text for the notification
+        return self.sheet.get(
+            f"{first_col}{start_row + 1}:{last_col}{end_row}",
+            value_render_option='UNFORMATTED_VALUE',
+            date_time_render_option='FORMATTED_STRING'
+        )
+    
+    def format_row_message(self, row_data, row_number, detected_at=None):
+        """Format row data into a readable message.
+        Pass detected_at when formatting a batch so the time is computed once.
+        """
+        if detected_at is None:
+            detected_at = get_bangkok_datetime_str()
         
-        message += f"\n⏰ Thời gian phát hiện: {get_bangkok_datetime_str()}"
-        return message
+        # Plain text (sent without parse_mode): cell values are user input and
+        # a stray '*' or '_' would make Telegram reject the whole batch
+        parts = [f"🆕 Dòng mới được thêm vào Google Sheets (Dòng #{row_number})\n\n"]
+        parts.extend(format_row_fields(row_data))
+        parts.append(f"\n⏰ Thời gian phát hiện: {detected_at}")
+        return "".join(parts)
+    
+    @retry_with_backoff()
+    async def initialize_bot(self):
+        """Open the bot's HTTP connection pool. This calls get_me, so it is
+        retried like any other API call instead of failing startup on a blip.
+        """
+        await self.bot.initialize()
+    
+    @retry_with_backoff()
+    async def post_telegram_message(self, message, parse_mode='Markdown'):
+        """Send message to Telegram, retrying on flood control and network errors"""
+        await self.bot.send_message(
+            chat_id=self.telegram_chat_id,
+            text=message,
+            parse_mode=parse_mode
+        )
     
-    async def send_telegram_message(self, message):
+    async def send_telegram_message(self, message, parse_mode='Markdown'):
         """Send message to Telegram"""
         try:
-            await self.bot.send_message(
-                chat_id=self.telegram_chat_id,
-                text=message,
-                parse_mode='Markdown'
-            )
+            await self.post_telegram_message(message, parse_mode)
             logger.info("Message sent to Telegram successfully")
         except Exception as e:
             logger.error(f"Error sending Telegram message: {e}")
     
+    def has_sheet_changed(self):
+        """Check the spreadsheet's Drive version so unchanged polls skip the Sheets reads.
+        Errors count as "changed" so a Drive hiccup never hides new rows.
+        """
+        try:
+            response = self.gc.request(
+                'get',
+                DRIVE_FILE_URL.format(self.sheets_id),
+                params={'fields': 'version', 'supportsAllDrives': True}
+            )
+            version = response.json()['version']
+        except Exception as e:
+            logger.warning(f"Error getting spreadsheet version: {e}")
+            return True
+        
+        if version == self.last_file_version:
+            return False
+        self.last_file_version = version
+        return True
+    
     async def check_for_new_rows(self):
-        """Check for new rows and send notifications"""
+        """Check for new rows and send notifications.
+        Returns True if new rows were found.
+        """
         try:
-            current_count = self.get_current_row_count()
+            # gspread is synchronous; run its HTTP calls in a worker thread so
+            # they (and their retry sleeps) don't block Telegram sends
+            if not await asyncio.to_thread(self.has_sheet_changed):
+                return False
+            
+            current_count = await asyncio.to_thread(self.get_current_row_count)
             
             if current_count > self.last_row_count:
                 logger.info(f"New rows detected: {current_count - self.last_row_count}")
                 
                 # Get new rows
-                new_rows = self.get_new_rows(self.last_row_count)
+                new_rows = await asyncio.to_thread(
+                    self.get_new_rows, self.last_row_count, current_count
+                )
                 
-                # Send notification for each new row
+                # Format each non-empty new row with one shared detection time
+                detected_at = get_bangkok_datetime_str()
+                blocks = []
                 for i, row in enumerate(new_rows):
-                    if any(cell.strip() for cell in row):  # Only process non-empty rows
+                    # The values API trims trailing empty cells, so blank rows come back as []
+                    if row:
                         row_number = self.last_row_count + i + 1
-                        message = self.format_row_message(row, row_number)
-                        await self.send_telegram_message(message)
-                        
-                        # Add small delay between messages if multiple rows
-                        if len(new_rows) > 1:
-                            await asyncio.sleep(1)
+                        blocks.append(self.format_row_message(row, row_number, detected_at))
                 
-                # Update last row count
+                # One message per batch, split only where Telegram's size limit requires.
+                # A message rejected for good (e.g. chat not found) is logged and dropped so
+                # it can't block the batch forever; if retries run out on a transient error
+                # the exception propagates and the batch is retried next poll.
+                for message in pack_message_blocks(blocks):
+                    try:
+                        await self.post_telegram_message(message, parse_mode=None)
+                    except Exception as e:
+                        if is_retryable_error(e):
+                            raise
+                        logger.error(f"Dropping new row notification Telegram rejected: {e}")
+                logger.info("New row notifications sent to Telegram")
+                
+                # Update last row count (flushed to disk by the monitoring loop)
                 self.last_row_count = current_count
-                self.save_last_row_count(current_count)
+                self.last_row_count_dirty = True
+                return True
+            
+            return False
                 
         except Exception as e:
             logger.error(f"Error checking for new rows: {e}")
+            # Forget the version so the next poll re-reads instead of skipping
+            self.last_file_version = None
+            return False
+    
+    def next_poll_interval(self, found_new_rows):
+        """Poll at the base interval while the sheet is active and back off
+        linearly (up to max_check_interval) while it stays quiet
+        """
+        if found_new_rows:
+            self.idle_ticks = 0
+        else:
+            self.idle_ticks += 1
+        return min(self.check_interval * (1 + self.idle_ticks), self.max_check_interval)
     
     async def start_monitoring(self):
         """Start the monitoring loop"""
@@ -179,30 +297,64 @@ class GoogleSheetsMonitor:
         startup_message = (
             f"🤖 **Telegram Bot đã khởi động**\n\n"
             f"📊 Đang theo dõi Google Sheets\n"
-            f"⏱️ Kiểm tra mỗi {self.check_interval} giây\n"
+            f"⏱️ Kiểm tra mỗi {self.check_interval}-{self.max_check_interval} giây\n"
             f"📝 Dòng hiện tại: {self.last_row_count}\n"
             f"🕐 Thời gian khởi động: {get_bangkok_datetime_str()}"
         )
         await self.send_telegram_message(startup_message)
         
-        while True:
-            try:
-                await self.check_for_new_rows()
-                await asyncio.sleep(self.check_interval)
-            except KeyboardInterrupt:
-                logger.info("Monitoring stopped by user")
-                break
-            except Exception as e:
-                logger.error(f"Error in monitoring loop: {e}")
-                await asyncio.sleep(self.check_interval)
+        # Stop cleanly on SIGTERM so the row count is flushed (not supported on Windows)
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, asyncio.current_task().cancel
+            )
+        except NotImplementedError:
+            pass
+        
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        try:
+            while True:
+                try:
+                    found_new_rows = await self.check_for_new_rows()
+                    interval = self.next_poll_interval(found_new_rows)
+                    
+                    # Flush on elapsed time, and as soon as polling slows down, so the
+                    # unsaved window doesn't stretch with the adaptive interval
+                    if (interval > self.check_interval
+                            or loop.time() - last_flush >= LAST_ROW_FLUSH_SECONDS):
+                        self.flush_last_row_count()
+                        last_flush = loop.time()
+                    
+                    await asyncio.sleep(interval)
+                except KeyboardInterrupt:
+                    logger.info("Monitoring stopped by user")
+                    break
+                except asyncio.CancelledError:
+                    # SIGTERM or the caller cancelled us; the finally below flushes
+                    logger.info("Monitoring cancelled")
+                    raise
+                except Exception as e:
+                    logger.error(f"Error in monitoring loop: {e}")
+                    await asyncio.sleep(self.next_poll_interval(False))
+        finally:
+            self.flush_last_row_count()
 
 async def main():
     """Main function"""
     try:
         monitor = GoogleSheetsMonitor()
-        await monitor.start_monitoring()
+        await monitor.initialize_bot()
+        try:
+            await monitor.start_monitoring()
+        finally:
+            # Closes the bot's HTTP connection pool when monitoring stops
+            await monitor.bot.shutdown()
     except Exception as e:
         logger.error(f"Error in main: {e}")
 
 if __name__ == "__main__":
+    # uvloop is optional (not available on Windows); fall back to the default loop
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main())
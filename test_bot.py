@@ -6,12 +6,11 @@ from telegram_bot import GoogleSheetsMonitor
 # Load environment variables
 load_dotenv()
 
-async def test_telegram_connection():
+async def test_telegram_connection(monitor):
     """Test Telegram bot connection"""
     print("🧪 Testing Telegram connection...")
     
     try:
-        monitor = GoogleSheetsMonitor()
         await monitor.send_telegram_message(
             "🧪 **Test Message**\n\n"
             "Đây là tin nhắn test từ Telegram Bot.\n"
@@ -21,18 +20,17 @@ async def test_telegram_connection():
     except Exception as e:
         print(f"❌ Telegram connection failed: {e}")
 
-async def test_google_sheets_connection():
+async def test_google_sheets_connection(monitor):
     """Test Google Sheets connection"""
     print("🧪 Testing Google Sheets connection...")
     
     try:
-        monitor = GoogleSheetsMonitor()
         current_count = monitor.get_current_row_count()
         print(f"✅ Google Sheets connection successful! Current rows: {current_count}")
         
         # Get first few rows as sample
         if current_count > 0:
-            sample_rows = monitor.get_new_rows(0)[:3]  # Get first 3 rows
+            sample_rows = monitor.get_new_rows(0, 3)  # Get first 3 rows
             print("📋 Sample data:")
             for i, row in enumerate(sample_rows):
                 print(f"   Row {i+1}: {row}")
@@ -40,13 +38,11 @@ async def test_google_sheets_connection():
     except Exception as e:
         print(f"❌ Google Sheets connection failed: {e}")
 
-async def test_full_functionality():
+async def test_full_functionality(monitor):
     """Test the complete bot functionality"""
     print("🧪 Testing complete bot functionality...")
     
     try:
-        monitor = GoogleSheetsMonitor()
-        
         # Test both connections
         current_count = monitor.get_current_row_count()
         print(f"📊 Current sheet rows: {current_count}")
@@ -55,7 +51,7 @@ async def test_full_functionality():
         test_message = (
             "🧪 **Full Functionality Test**\n\n"
             f"📊 Google Sheets đang có {current_count} dòng\n"
-            f"⏱️ Kiểm tra mỗi {monitor.check_interval} giây\n"
+            f"⏱️ Kiểm tra mỗi {monitor.check_interval}-{monitor.max_check_interval} giây\n"
             "🚀 Bot sẵn sàng hoạt động!"
         )
         
@@ -86,12 +82,20 @@ async def main():
         print("Please check your .env file and try again.")
         return
     
+    # Share one monitor across tests so Google auth and the initial
+    # row count are only done once
+    try:
+        monitor = GoogleSheetsMonitor()
+    except Exception as e:
+        print(f"❌ Could not initialize bot: {e}")
+        return
+    
     # Run tests
-    await test_telegram_connection()
+    await test_telegram_connection(monitor)
     print()
-    await test_google_sheets_connection()
+    await test_google_sheets_connection(monitor)
     print()
-    await test_full_functionality()
+    await test_full_functionality(monitor)
     print("\n🎉 All tests completed!")
 
 if __name__ == "__main__":